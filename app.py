@@ -4,22 +4,96 @@ DEVINA - WOMEN'S SAFETY MAP
 
 """
 
+# Must run before anything else imports socket/threading so blocking
+# calls (requests, the monitor pool) become cooperative green threads.
+import eventlet
+eventlet.monkey_patch()
+
 from flask import Flask, render_template, request, jsonify
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
+import itertools
+import json
+import logging
 import requests
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter, Retry
 from safety_engine import calculate_safety_score
 from datetime import datetime
 
+logger = logging.getLogger('paddos')
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'paddos-safety-key-2025'
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
+
+MONITOR_INTERVAL = 30
+MAX_SESSIONS = 1000
+SESSION_TTL = 3600
+
+_geo_adapter = HTTPAdapter(
+    pool_connections=4, pool_maxsize=8,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504])
+)
+geo_session = requests.Session()
+geo_session.mount('https://', _geo_adapter)
+geo_session.mount('http://', _geo_adapter)
 
 active_sessions = {}
-session_lock = threading.Lock()
+
+monitor_pool = ThreadPoolExecutor(max_workers=8)
+_monitor_started = False
+_monitor_lock = threading.Lock()
+
+
+class MonitorSession:
+    """Per-client monitoring state
+
+    Mutated without a lock: single-word writes (active) and dict
+    set/pop on active_sessions are atomic under the GIL, and
+    update_count is bumped through an itertools counter by the single
+    scheduler writer. A stale True read of active costs at most one
+    extra emit.
+    """
+    __slots__ = ('latitude', 'longitude', 'country_code', 'active',
+                 'update_count', 'places_digest', 'started_at', '_counter')
+
+    def __init__(self, lat, lon, country_code):
+        self.latitude = lat
+        self.longitude = lon
+        self.country_code = country_code
+        self.active = True
+        self.update_count = 0
+        self.places_digest = None
+        self.started_at = time.time()
+        self._counter = itertools.count(1)
+
+    def expired(self, now):
+        return now - self.started_at > SESSION_TTL
+
+    def bump(self):
+        self.update_count = next(self._counter)
+
+
+# Fields that change between ticks even when the nearby places don't;
+# everything else only needs resending when the place data changes.
+DELTA_FIELDS = ('score', 'rating', 'color', 'confidence', 'timestamp',
+                'breakdown', 'time_period', 'service_status')
+
+
+def _places_digest(result):
+    """Fingerprint of the place-derived parts of a safety result"""
+    stable = {key: result.get(key) for key in ('nearest', 'all_places', 'stats')}
+    return hash(json.dumps(stable, sort_keys=True))
+
+
+def _valid_coords(lat, lon) -> bool:
+    """Single range check for coordinates; 0.0 is a valid latitude/longitude"""
+    return (isinstance(lat, (int, float)) and isinstance(lon, (int, float))
+            and -90 <= lat <= 90 and -180 <= lon <= 180)
 
 
 def get_location_multi_source():
@@ -45,12 +119,12 @@ def get_location_multi_source():
     
     for api in apis:
         try:
-            resp = requests.get(api['url'], timeout=5)
+            resp = geo_session.get(api['url'], timeout=(3, 5))
             if resp.status_code == 200:
                 loc = api['parse'](resp.json())
                 if loc['lat'] and loc['lon']:
                     return loc
-        except:
+        except (requests.RequestException, ValueError, KeyError, TypeError):
             continue
     return None
 
@@ -74,34 +148,30 @@ def api_safety():
         data = request.json
         lat = data.get('latitude')
         lon = data.get('longitude')
-        country_code = data.get('country_code', 'XX')
-        
-        if not (lat and lon):
+        country_code = (data.get('country_code') or 'XX').upper()
+
+        if not _valid_coords(lat, lon):
             return jsonify({'success': False, 'error': 'Invalid coordinates'}), 400
-        
-        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
-            return jsonify({'success': False, 'error': 'Coordinates out of range'}), 400
-        
+
         result = calculate_safety_score(lat, lon, country_code)
         return jsonify({'success': True, 'data': result})
         
     except Exception as e:
-        print(f"API Error: {e}")
+        logger.exception("API error")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
 @socketio.on('connect')
 def handle_connect():
-    print(f'✓ Client connected: {request.sid}')
+    logger.info('Client connected: %s', request.sid)
     emit('connected', {'message': 'Connected to Paddos'})
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    with session_lock:
-        if request.sid in active_sessions:
-            active_sessions[request.sid]['active'] = False
-            del active_sessions[request.sid]
+    session = active_sessions.pop(request.sid, None)
+    if session:
+        session.active = False
 
 
 @socketio.on('start_monitoring')
@@ -109,24 +179,20 @@ def handle_start_monitoring(data):
     try:
         lat = data.get('latitude')
         lon = data.get('longitude')
-        country_code = data.get('country_code', 'XX')
-        
-        if not (lat and lon):
+        country_code = (data.get('country_code') or 'XX').upper()
+
+        if not _valid_coords(lat, lon):
             emit('error', {'message': 'Invalid coordinates'})
             return
-        
-        with session_lock:
-            active_sessions[request.sid] = {
-                'active': True, 'latitude': lat, 'longitude': lon,
-                'country_code': country_code, 'update_count': 0
-            }
-        
-        thread = threading.Thread(
-            target=monitor_location,
-            args=(request.sid, lat, lon, country_code),
-            daemon=True
-        )
-        thread.start()
+
+        if request.sid not in active_sessions and len(active_sessions) >= MAX_SESSIONS:
+            emit('error', {'message': 'Server at capacity, please try again later'})
+            return
+
+        active_sessions[request.sid] = MonitorSession(lat, lon, country_code)
+
+        _ensure_monitor_loop()
+        monitor_pool.submit(_push_safety_update, request.sid)
         emit('monitoring_started', {'message': 'Monitoring started'})
         
     except Exception as e:
@@ -135,40 +201,88 @@ def handle_start_monitoring(data):
 
 @socketio.on('stop_monitoring')
 def handle_stop_monitoring():
-    with session_lock:
-        if request.sid in active_sessions:
-            active_sessions[request.sid]['active'] = False
-            del active_sessions[request.sid]
-            emit('monitoring_stopped', {'message': 'Monitoring stopped'})
+    session = active_sessions.pop(request.sid, None)
+    if session:
+        session.active = False
+        emit('monitoring_stopped', {'message': 'Monitoring stopped'})
 
 
-def monitor_location(session_id, lat, lon, country_code):
-    while True:
-        with session_lock:
-            if session_id not in active_sessions or not active_sessions[session_id]['active']:
-                break
-        
-        try:
-            result = calculate_safety_score(lat, lon, country_code)
-            
-            with session_lock:
-                if session_id in active_sessions:
-                    active_sessions[session_id]['update_count'] += 1
-            
+def _push_safety_update(session_id):
+    """Compute and emit one safety update for a single session"""
+    session = active_sessions.get(session_id)
+    if not session or not session.active:
+        return
+
+    try:
+        result = calculate_safety_score(
+            session.latitude, session.longitude, session.country_code
+        )
+
+        if not session.active:
+            return
+        session.bump()
+
+        digest = _places_digest(result)
+        if digest == session.places_digest:
+            delta = {key: result[key] for key in DELTA_FIELDS if key in result}
+            socketio.emit('safety_update_delta', delta, room=session_id)
+        else:
+            session.places_digest = digest
             socketio.emit('safety_update', result, room=session_id)
-            time.sleep(30)
-            
-        except Exception as e:
-            print(f'Monitor error: {e}')
-            time.sleep(5)
+
+    except Exception:
+        logger.exception('Monitor error for session %s', session_id)
+
+
+def _sweep_expired_sessions():
+    """Evict leaked sessions: past TTL with the client no longer connected
+
+    Connected clients are never evicted, however long they monitor;
+    the TTL only bounds how long an entry whose disconnect was lost
+    (network drop, crash) can keep being scheduled.
+    """
+    now = time.time()
+    for session_id, session in list(active_sessions.items()):
+        if not session.expired(now):
+            continue
+        if socketio.server.manager.is_connected(session_id, '/'):
+            continue
+        active_sessions.pop(session_id, None)
+        session.active = False
+        logger.info('Evicted stale session %s', session_id)
+
+
+def monitor_loop():
+    """Single scheduler: fan out one update per active session every 30s"""
+    while True:
+        socketio.sleep(MONITOR_INTERVAL)
+
+        _sweep_expired_sessions()
+
+        for session_id in list(active_sessions):
+            monitor_pool.submit(_push_safety_update, session_id)
+
+
+def _ensure_monitor_loop():
+    """Start the shared monitor loop once, on first use"""
+    global _monitor_started
+    with _monitor_lock:
+        if not _monitor_started:
+            socketio.start_background_task(monitor_loop)
+            _monitor_started = True
 
 
 if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s'
+    )
+
     print("\n" + "="*70)
     print("🛡️  DEVINA - WOMEN'S SAFETY MAP".center(70))
     print("="*70)
     print("\n✓ Server starting at http://localhost:5000")
     print("✓ Press Ctrl+C to stop\n")
     
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
+    socketio.run(app, debug=False, host='0.0.0.0', port=5000)
 
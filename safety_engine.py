@@ -1,324 +1,743 @@
-"""
-PADDOS SAFETY ENGINE
-====================
-Advanced safety calculation with service availability detection
-"""
-
-import requests
-import math
-from datetime import datetime
-from typing import Dict, List, Tuple
-
-OVERPASS_URL = "https://overpass-api.de/api/interpreter"
-TIMEOUT = 15
-
-COUNTRY_BASELINES = {
-    'NO': 1.18, 'SE': 1.16, 'DK': 1.16, 'FI': 1.17, 'CH': 1.15,
-    'CA': 1.11, 'DE': 1.10, 'AU': 1.09, 'GB': 1.08, 'US': 1.04,
-    'IN': 0.88, 'BR': 0.89, 'CN': 0.94, 'MX': 0.84, 'DEFAULT': 1.00
-}
-
-WEIGHTS = {
-    'temporal_risk': 0.28,
-    'emergency_proximity': 0.27,
-    'population_density': 0.25,
-    'infrastructure': 0.20
-}
-
-
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """Haversine distance"""
-    try:
-        R = 6371
-        φ1, φ2 = math.radians(lat1), math.radians(lat2)
-        Δφ, Δλ = math.radians(lat2 - lat1), math.radians(lon2 - lon1)
-        a = math.sin(Δφ/2)**2 + math.cos(φ1) * math.cos(φ2) * math.sin(Δλ/2)**2
-        return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    except:
-        return float('inf')
-
-
-def fetch_osm_data(query: str) -> Tuple[List[Dict], bool]:
-    """Fetch OSM data with success indicator"""
-    try:
-        response = requests.post(OVERPASS_URL, data={'data': query}, timeout=TIMEOUT)
-        if response.status_code == 200:
-            elements = response.json().get('elements', [])
-            return elements, True
-        return [], False
-    except:
-        return [], False
-
-
-def get_nearby_places(lat: float, lon: float, place_type: str, radius: int) -> Tuple[List[Dict], bool]:
-    """Get nearby places with success status"""
-    queries = {
-        'hospital': f'node["amenity"="hospital"](around:{radius},{lat},{lon}); way["amenity"="hospital"](around:{radius},{lat},{lon});',
-        'police': f'node["amenity"="police"](around:{radius},{lat},{lon}); way["amenity"="police"](around:{radius},{lat},{lon});',
-        'bus_stop': f'node["highway"="bus_stop"](around:{radius},{lat},{lon});',
-        'train': f'node["railway"="station"](around:{radius},{lat},{lon});',
-        'activity': f'node["shop"](around:{radius},{lat},{lon}); node["amenity"="restaurant"](around:{radius},{lat},{lon});',
-        'infrastructure': f'node["highway"="street_lamp"](around:{radius},{lat},{lon}); way["lit"="yes"](around:{radius},{lat},{lon});'
-    }
-    
-    if place_type not in queries:
-        return [], False
-    
-    query = f"[out:json][timeout:{TIMEOUT}]; ({queries[place_type]}); out center;"
-    elements, success = fetch_osm_data(query)
-    
-    if not success:
-        return [], False
-    
-    places = []
-    for elem in elements:
-        try:
-            e_lat = elem.get('lat') or elem.get('center', {}).get('lat')
-            e_lon = elem.get('lon') or elem.get('center', {}).get('lon')
-            
-            if not (e_lat and e_lon):
-                continue
-            
-            dist = calculate_distance(lat, lon, e_lat, e_lon)
-            if dist == float('inf'):
-                continue
-            
-            name = elem.get('tags', {}).get('name', f'{place_type.title()}')
-            
-            places.append({
-                'name': name,
-                'type': place_type,
-                'distance': round(dist, 2),
-                'latitude': e_lat,
-                'longitude': e_lon
-            })
-        except:
-            continue
-    
-    return sorted(places, key=lambda x: x['distance']), True
-
-
-def calculate_safety_score(lat: float, lon: float, country_code: str = 'XX') -> Dict:
-    """
-    Calculate safety score with service availability detection
-    """
-    
-    print(f"\n{'='*70}")
-    print(f"PADDOS: Calculating for ({lat:.4f}, {lon:.4f})")
-    print(f"{'='*70}")
-    
-    try:
-        # Time-based risk (always available)
-        hour = datetime.now().hour
-        if 9 <= hour <= 18:
-            time_score, period = 88, f"{hour}:00 - Low Risk"
-        elif 7 <= hour < 9 or 18 < hour <= 20:
-            time_score, period = 62, f"{hour}:00 - Moderate Risk"
-        else:
-            time_score, period = 25, f"{hour}:00 - High Risk"
-        
-        print(f"✓ Time: {time_score}")
-        
-        # Get data with success tracking
-        hospitals, hosp_success = get_nearby_places(lat, lon, 'hospital', 5000)
-        police, police_success = get_nearby_places(lat, lon, 'police', 5000)
-        bus_stops, bus_success = get_nearby_places(lat, lon, 'bus_stop', 1000)
-        trains, train_success = get_nearby_places(lat, lon, 'train', 2000)
-        activity, activity_success = get_nearby_places(lat, lon, 'activity', 600)
-        infra, infra_success = get_nearby_places(lat, lon, 'infrastructure', 500)
-        
-        # Check if minimum required data is available
-        services_available = (hosp_success or police_success) and activity_success
-        
-        if not services_available:
-            print("✗ Minimum required data NOT available")
-            return {
-                'score': 0,
-                'rating': "SERVICE UNAVAILABLE",
-                'color': "#999999",
-                'confidence': 0,
-                'timestamp': datetime.now().isoformat(),
-                'breakdown': {
-                    'temporal_risk': 0,
-                    'emergency_proximity': 0,
-                    'population_density': 0,
-                    'infrastructure': 0
-                },
-                'time_period': period,
-                'service_status': {
-                    'overall': "Sorry, we don't have services running for this location",
-                    'status_color': "#f44336",
-                    'unavailable': ['emergency_services', 'activity_data'],
-                    'message': "Paddos is not available in this area yet. We're working to expand our coverage!"
-                },
-                'nearest': {
-                    'hospital': None,
-                    'police': None,
-                    'bus_stop': None,
-                    'train_station': None
-                },
-                'all_places': {
-                    'hospitals': [],
-                    'police_stations': [],
-                    'bus_stops': [],
-                    'train_stations': []
-                },
-                'stats': {
-                    'activity_count': 0,
-                    'infrastructure_count': 0,
-                    'emergency_services_density': 0
-                }
-            }
-        
-        print(f"✓ Data: {len(hospitals)} hospitals, {len(police)} police, {len(activity)} activity")
-        
-        # Emergency proximity
-        emergency = hospitals + police
-        if emergency:
-            min_dist = min(p['distance'] for p in emergency)
-            if min_dist <= 0.8:
-                emerg_score = 96
-            elif min_dist <= 1.5:
-                emerg_score = 85
-            elif min_dist <= 2.5:
-                emerg_score = 70
-            elif min_dist <= 4.0:
-                emerg_score = 50
-            else:
-                emerg_score = 30
-        else:
-            emerg_score = 22
-        
-        # Population density
-        act_count = len(activity)
-        if act_count >= 60:
-            pop_score = 92
-        elif act_count >= 40:
-            pop_score = 82
-        elif act_count >= 25:
-            pop_score = 68
-        elif act_count >= 12:
-            pop_score = 50
-        else:
-            pop_score = 35
-        
-        if hour < 6 or hour > 22:
-            pop_score *= 0.7
-        
-        # Infrastructure
-        infra_count = len(infra) + len(bus_stops) + len(trains)
-        if 6 <= hour <= 19:
-            infra_score = 80 if infra_count >= 20 else 65
-        else:
-            if infra_count >= 20:
-                infra_score = 85
-            elif infra_count >= 10:
-                infra_score = 60
-            else:
-                infra_score = 30
-        
-        # Calculate weighted score
-        raw_score = (
-            time_score * WEIGHTS['temporal_risk'] +
-            emerg_score * WEIGHTS['emergency_proximity'] +
-            pop_score * WEIGHTS['population_density'] +
-            infra_score * WEIGHTS['infrastructure']
-        )
-        
-        multiplier = COUNTRY_BASELINES.get(country_code.upper(), COUNTRY_BASELINES['DEFAULT'])
-        final_score = min(max(raw_score * multiplier, 0), 100)
-        
-        # Rating
-        if final_score >= 75:
-            rating, color = "SAFE", "#4CAF50"
-        elif final_score >= 55:
-            rating, color = "MODERATE", "#FFC107"
-        elif final_score >= 35:
-            rating, color = "CAUTION", "#FF9800"
-        else:
-            rating, color = "HIGH RISK", "#F44336"
-        
-        print(f"✓ Final: {final_score:.1f} ({rating})\n")
-        
-        # Calculate confidence
-        data_quality = sum([hosp_success, police_success, activity_success, infra_success]) / 4
-        confidence = round(data_quality * 85, 1)
-        
-        # Service status
-        unavailable = []
-        if not hosp_success and not police_success:
-            unavailable.append('emergency_services')
-        if not activity_success:
-            unavailable.append('activity_data')
-        if not infra_success:
-            unavailable.append('infrastructure')
-        
-        status_msg = "All services operational" if not unavailable else f"Limited data: {', '.join(unavailable)}"
-        status_color = "#4CAF50" if not unavailable else "#FF9800"
-        
-        return {
-            'score': round(final_score, 1),
-            'rating': rating,
-            'color': color,
-            'confidence': confidence,
-            'timestamp': datetime.now().isoformat(),
-            'breakdown': {
-                'temporal_risk': round(time_score, 1),
-                'emergency_proximity': round(emerg_score, 1),
-                'population_density': round(pop_score, 1),
-                'infrastructure': round(infra_score, 1)
-            },
-            'time_period': period,
-            'service_status': {
-                'overall': status_msg,
-                'status_color': status_color,
-                'unavailable': unavailable,
-                'message': None
-            },
-            'nearest': {
-                'hospital': hospitals[0] if hospitals else None,
-                'police': police[0] if police else None,
-                'bus_stop': bus_stops[0] if bus_stops else None,
-                'train_station': trains[0] if trains else None
-            },
-            'all_places': {
-                'hospitals': hospitals[:5],
-                'police_stations': police[:5],
-                'bus_stops': bus_stops[:10],
-                'train_stations': trains[:5]
-            },
-            'stats': {
-                'activity_count': act_count,
-                'infrastructure_count': infra_count,
-                'emergency_services_density': round(len(emergency) / 25, 2) if emergency else 0
-            }
-        }
-        
-    except Exception as e:
-        print(f"✗ Critical Error: {e}")
-        import traceback
-        traceback.print_exc()
-        
-        return {
-            'score': 0,
-            'rating': "ERROR",
-            'color': "#999999",
-            'confidence': 0,
-            'timestamp': datetime.now().isoformat(),
-            'breakdown': {
-                'temporal_risk': 0,
-                'emergency_proximity': 0,
-                'population_density': 0,
-                'infrastructure': 0
-            },
-            'time_period': f"{datetime.now().hour}:00",
-            'service_status': {
-                'overall': "System error occurred",
-                'status_color': "#f44336",
-                'unavailable': ['all'],
-                'message': f"Error: {str(e)[:100]}"
-            },
-            'nearest': {'hospital': None, 'police': None, 'bus_stop': None, 'train_station': None},
-            'all_places': {'hospitals': [], 'police_stations': [], 'bus_stops': [], 'train_stations': []},
-            'stats': {'activity_count': 0, 'infrastructure_count': 0, 'emergency_services_density': 0}
-        }
+"""
+PADDOS SAFETY ENGINE
+====================
+Advanced safety calculation with service availability detection
+"""
+
+import requests
+import heapq
+import itertools
+import logging
+import math
+import operator
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from requests.adapters import HTTPAdapter, Retry
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+logger = logging.getLogger('paddos.engine')
+
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+CONNECT_TIMEOUT = 3
+TIMEOUT = 15
+
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=16, pool_maxsize=32,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504])
+))
+
+CACHE_TTL = 300
+CACHE_MAX_ENTRIES = 256
+
+_BY_DISTANCE = operator.itemgetter('distance')
+
+_osm_cache = OrderedDict()
+_osm_cache_lock = threading.Lock()
+
+
+def _cache_get(key: Tuple):
+    """Return a cached value if present and fresh, else None"""
+    with _osm_cache_lock:
+        entry = _osm_cache.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        if time.time() - stored_at >= CACHE_TTL:
+            del _osm_cache[key]
+            return None
+        _osm_cache.move_to_end(key)
+        return value
+
+
+def _cache_put(key: Tuple, value) -> None:
+    """Store a value, evicting the least recently used entry if full"""
+    with _osm_cache_lock:
+        _osm_cache[key] = (value, time.time())
+        _osm_cache.move_to_end(key)
+        while len(_osm_cache) > CACHE_MAX_ENTRIES:
+            _osm_cache.popitem(last=False)
+
+
+def _cache_key(lat: float, lon: float) -> Tuple[float, float]:
+    """Snap coordinates to a ~100 m grid so nearby calls share entries"""
+    return round(lat, 3), round(lon, 3)
+
+PLACE_RADII = {
+    'hospital': 5000,
+    'police': 5000,
+    'bus_stop': 1000,
+    'train': 2000,
+    'activity': 600,
+    'infrastructure': 500
+}
+
+COUNTRY_BASELINES = {
+    'NO': 1.18, 'SE': 1.16, 'DK': 1.16, 'FI': 1.17, 'CH': 1.15,
+    'CA': 1.11, 'DE': 1.10, 'AU': 1.09, 'GB': 1.08, 'US': 1.04,
+    'IN': 0.88, 'BR': 0.89, 'CN': 0.94, 'MX': 0.84, 'DEFAULT': 1.00
+}
+
+_DEFAULT_BASELINE = COUNTRY_BASELINES['DEFAULT']
+
+WEIGHTS = {
+    'temporal_risk': 0.28,
+    'emergency_proximity': 0.27,
+    'population_density': 0.25,
+    'infrastructure': 0.20
+}
+
+
+def _hour_entry(hour: int) -> Tuple[int, str, float, bool]:
+    """Precompute (time_score, period label, pop multiplier, is_day) for an hour"""
+    if 9 <= hour <= 18:
+        time_score, period = 88, f"{hour}:00 - Low Risk"
+    elif 7 <= hour < 9 or 18 < hour <= 20:
+        time_score, period = 62, f"{hour}:00 - Moderate Risk"
+    else:
+        time_score, period = 25, f"{hour}:00 - High Risk"
+
+    pop_multiplier = 0.7 if hour < 6 or hour > 22 else 1.0
+    is_day = 6 <= hour <= 19
+    return time_score, period, pop_multiplier, is_day
+
+
+_HOUR_TABLE = [_hour_entry(hour) for hour in range(24)]
+
+
+def _rating_color(score: float) -> Tuple[str, str]:
+    """Map a final score to its rating label and display color"""
+    if score >= 75:
+        return "SAFE", "#4CAF50"
+    elif score >= 55:
+        return "MODERATE", "#FFC107"
+    elif score >= 35:
+        return "CAUTION", "#FF9800"
+    return "HIGH RISK", "#F44336"
+
+
+def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Haversine distance"""
+    try:
+        R = 6371
+        φ1, φ2 = math.radians(lat1), math.radians(lat2)
+        Δφ, Δλ = math.radians(lat2 - lat1), math.radians(lon2 - lon1)
+        a = math.sin(Δφ/2)**2 + math.cos(φ1) * math.cos(φ2) * math.sin(Δλ/2)**2
+        return R * 2 * math.asin(math.sqrt(min(1.0, a)))
+    except (TypeError, ValueError):
+        return float('inf')
+
+
+def fetch_osm_data(query: str) -> Tuple[List[Dict], bool]:
+    """Fetch OSM data with success indicator"""
+    try:
+        response = SESSION.post(
+            OVERPASS_URL, data={'data': query},
+            headers={'Accept-Encoding': 'gzip'}, timeout=(CONNECT_TIMEOUT, TIMEOUT)
+        )
+        if response.status_code == 200:
+            elements = _json_loads(response.content).get('elements', [])
+            return elements, True
+        return [], False
+    except (requests.RequestException, ValueError) as e:
+        logger.debug("Overpass fetch failed: %s", e)
+        return [], False
+
+
+_QUERY_TEMPLATES = {
+    'hospital': 'node["amenity"="hospital"](around:{r},{lat},{lon}); way["amenity"="hospital"](around:{r},{lat},{lon});',
+    'police': 'node["amenity"="police"](around:{r},{lat},{lon}); way["amenity"="police"](around:{r},{lat},{lon});',
+    'bus_stop': 'node["highway"="bus_stop"](around:{r},{lat},{lon});',
+    'train': 'node["railway"="station"](around:{r},{lat},{lon});',
+    'activity': 'node["shop"](around:{r},{lat},{lon}); node["amenity"="restaurant"](around:{r},{lat},{lon});',
+    'infrastructure': 'node["highway"="street_lamp"](around:{r},{lat},{lon}); way["lit"="yes"](around:{r},{lat},{lon});'
+}
+
+
+def _query_clause(place_type: str, radius: int, lat: float, lon: float) -> str:
+    """Fill in the Overpass QL clause template for a single place category"""
+    template = _QUERY_TEMPLATES.get(place_type)
+    if template is None:
+        return ''
+    return template.format(r=radius, lat=lat, lon=lon)
+
+
+def _classify_element(tags: Dict) -> str:
+    """Map an element's tags back to the place category that matched it"""
+    if tags.get('amenity') == 'hospital':
+        return 'hospital'
+    if tags.get('amenity') == 'police':
+        return 'police'
+    if tags.get('highway') == 'bus_stop':
+        return 'bus_stop'
+    if tags.get('railway') == 'station':
+        return 'train'
+    if 'shop' in tags or tags.get('amenity') == 'restaurant':
+        return 'activity'
+    if tags.get('highway') == 'street_lamp' or tags.get('lit') == 'yes':
+        return 'infrastructure'
+    return ''
+
+
+def _haversine_many(lat: float, lon: float, e_lats: List[float], e_lons: List[float]) -> List[float]:
+    """Haversine distances from one point to many, vectorized with NumPy"""
+    φ1 = math.radians(lat)
+    φ2 = np.radians(np.asarray(e_lats, dtype=np.float64))
+    Δφ = φ2 - φ1
+    Δλ = np.radians(np.asarray(e_lons, dtype=np.float64) - lon)
+    a = np.sin(Δφ/2)**2 + math.cos(φ1) * np.cos(φ2) * np.sin(Δλ/2)**2
+    return 6371 * 2 * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+
+
+def _build_places(lat: float, lon: float, elements: List[Tuple[str, Dict]]) -> Dict[str, List[Dict]]:
+    """Build per-category place lists from (place_type, element) pairs"""
+    pending = []
+    for place_type, elem in elements:
+        e_lat = elem.get('lat', elem.get('center', {}).get('lat'))
+        e_lon = elem.get('lon', elem.get('center', {}).get('lon'))
+
+        if e_lat is None or e_lon is None:
+            continue
+
+        name = elem.get('tags', {}).get('name', f'{place_type.title()}')
+        pending.append((place_type, name, e_lat, e_lon))
+
+    if np is not None and pending:
+        distances = _haversine_many(lat, lon, [p[2] for p in pending], [p[3] for p in pending])
+    else:
+        distances = [calculate_distance(lat, lon, p[2], p[3]) for p in pending]
+
+    results = {}
+    for (place_type, name, e_lat, e_lon), dist in zip(pending, distances):
+        if not math.isfinite(dist):
+            continue
+
+        results.setdefault(place_type, []).append({
+            'name': name,
+            'type': place_type,
+            'distance': round(float(dist), 2),
+            'latitude': e_lat,
+            'longitude': e_lon
+        })
+
+    return results
+
+
+def _fetch_places_parallel(lat: float, lon: float) -> Tuple[Dict[str, List[Dict]], Dict[str, bool]]:
+    """Fetch each category concurrently; used when the batched query fails"""
+    with ThreadPoolExecutor(max_workers=len(PLACE_RADII)) as pool:
+        futures = {
+            place_type: pool.submit(get_nearby_places, lat, lon, place_type, radius)
+            for place_type, radius in PLACE_RADII.items()
+        }
+
+    results, statuses = {}, {}
+    for place_type, future in futures.items():
+        results[place_type], statuses[place_type] = future.result()
+
+    return results, statuses
+
+
+def fetch_all_places(lat: float, lon: float) -> Tuple[Dict[str, List[Dict]], Dict[str, bool]]:
+    """Fetch every place category in one batched Overpass request
+
+    Returns per-category place lists and per-category success flags;
+    the batched query succeeds or fails as a whole, but the concurrent
+    per-category fallback can report partial success. Returned lists
+    are unsorted; callers that only need the closest K places should
+    select them with heapq.nsmallest instead of sorting.
+    """
+    cache_key = ('all',) + _cache_key(lat, lon)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
+
+    clauses = ''.join(
+        _query_clause(place_type, radius, lat, lon)
+        for place_type, radius in PLACE_RADII.items()
+    )
+    query = f"[out:json][timeout:{TIMEOUT}]; ({clauses}); out center qt;"
+    elements, success = fetch_osm_data(query)
+
+    if not success:
+        return _fetch_places_parallel(lat, lon)
+
+    tagged = []
+    for elem in elements:
+        place_type = _classify_element(elem.get('tags', {}))
+        if place_type:
+            tagged.append((place_type, elem))
+
+    results = {place_type: [] for place_type in PLACE_RADII}
+    results.update(_build_places(lat, lon, tagged))
+    statuses = {place_type: True for place_type in PLACE_RADII}
+
+    _cache_put(cache_key, (results, statuses))
+    return results, statuses
+
+
+def get_nearby_places(lat: float, lon: float, place_type: str, radius: int,
+                      top_k: int = None) -> Tuple[List[Dict], bool]:
+    """Get nearby places with success status, closest first
+
+    If top_k is given, only the closest top_k places are returned,
+    selected with heapq.nsmallest (O(N log K) instead of a full sort).
+    """
+    clause = _query_clause(place_type, radius, lat, lon)
+    if not clause:
+        return [], False
+
+    cache_key = (place_type,) + _cache_key(lat, lon) + (radius,)
+    places = _cache_get(cache_key)
+
+    if places is None:
+        query = f"[out:json][timeout:{TIMEOUT}]; ({clause}); out center qt;"
+        elements, success = fetch_osm_data(query)
+
+        if not success:
+            return [], False
+
+        built = _build_places(lat, lon, [(place_type, elem) for elem in elements])
+        places = built.get(place_type, [])
+        _cache_put(cache_key, places)
+
+    if top_k is not None:
+        return heapq.nsmallest(top_k, places, key=_BY_DISTANCE), True
+    return sorted(places, key=_BY_DISTANCE), True
+
+
+def calculate_safety_score(lat: float, lon: float, country_code: str = 'XX') -> Dict:
+    """
+    Calculate safety score with service availability detection
+
+    country_code is expected upper-case (normalized at the API edge);
+    unknown codes fall back to the DEFAULT baseline.
+    """
+    
+    logger.debug("Calculating for (%.4f, %.4f)", lat, lon)
+
+
+    try:
+        # Time-based risk (always available, precomputed per hour)
+        now = datetime.now()
+        hour = now.hour
+        time_score, period, pop_multiplier, is_day = _HOUR_TABLE[hour]
+
+        logger.debug("Time score: %d", time_score)
+        
+        # Get data with success tracking (single batched Overpass request,
+        # cached with success-only TTL entries in _osm_cache)
+        places, statuses = fetch_all_places(lat, lon)
+        hospitals, police = places['hospital'], places['police']
+        bus_stops, trains = places['bus_stop'], places['train']
+        activity, infra = places['activity'], places['infrastructure']
+        hosp_success, police_success = statuses['hospital'], statuses['police']
+        activity_success, infra_success = statuses['activity'], statuses['infrastructure']
+        
+        # Check if minimum required data is available
+        services_available = (hosp_success or police_success) and activity_success
+        
+        if not services_available:
+            logger.warning("Minimum required data not available for (%.4f, %.4f)", lat, lon)
+            return {
+                'score': 0,
+                'rating': "SERVICE UNAVAILABLE",
+                'color': "#999999",
+                'confidence': 0,
+                'timestamp': now.isoformat(),
+                'breakdown': {
+                    'temporal_risk': 0,
+                    'emergency_proximity': 0,
+                    'population_density': 0,
+                    'infrastructure': 0
+                },
+                'time_period': period,
+                'service_status': {
+                    'overall': "Sorry, we don't have services running for this location",
+                    'status_color': "#f44336",
+                    'unavailable': ['emergency_services', 'activity_data'],
+                    'message': "Paddos is not available in this area yet. We're working to expand our coverage!"
+                },
+                'nearest': {
+                    'hospital': None,
+                    'police': None,
+                    'bus_stop': None,
+                    'train_station': None
+                },
+                'all_places': {
+                    'hospitals': [],
+                    'police_stations': [],
+                    'bus_stops': [],
+                    'train_stations': []
+                },
+                'stats': {
+                    'activity_count': 0,
+                    'infrastructure_count': 0,
+                    'emergency_services_density': 0
+                }
+            }
+        
+        logger.debug("Data: %d hospitals, %d police, %d activity",
+                     len(hospitals), len(police), len(activity))
+        
+        # Emergency proximity (chained iteration, no concatenated copy)
+        emergency_count = len(hospitals) + len(police)
+        if emergency_count:
+            min_dist = min(p['distance'] for p in itertools.chain(hospitals, police))
+            if min_dist <= 0.8:
+                emerg_score = 96
+            elif min_dist <= 1.5:
+                emerg_score = 85
+            elif min_dist <= 2.5:
+                emerg_score = 70
+            elif min_dist <= 4.0:
+                emerg_score = 50
+            else:
+                emerg_score = 30
+        else:
+            emerg_score = 22
+        
+        # Population density
+        act_count = len(activity)
+        if act_count >= 60:
+            pop_score = 92
+        elif act_count >= 40:
+            pop_score = 82
+        elif act_count >= 25:
+            pop_score = 68
+        elif act_count >= 12:
+            pop_score = 50
+        else:
+            pop_score = 35
+        
+        pop_score *= pop_multiplier
+
+        # Infrastructure
+        infra_count = len(infra) + len(bus_stops) + len(trains)
+        if is_day:
+            infra_score = 80 if infra_count >= 20 else 65
+        else:
+            if infra_count >= 20:
+                infra_score = 85
+            elif infra_count >= 10:
+                infra_score = 60
+            else:
+                infra_score = 30
+        
+        # Calculate weighted score
+        raw_score = (
+            time_score * WEIGHTS['temporal_risk'] +
+            emerg_score * WEIGHTS['emergency_proximity'] +
+            pop_score * WEIGHTS['population_density'] +
+            infra_score * WEIGHTS['infrastructure']
+        )
+        
+        multiplier = COUNTRY_BASELINES.get(country_code, _DEFAULT_BASELINE)
+        final_score = min(max(raw_score * multiplier, 0), 100)
+        
+        # Rating
+        rating, color = _rating_color(final_score)
+        
+        logger.info("Final score %.1f (%s)", final_score, rating)
+        
+        # Calculate confidence
+        data_quality = sum([hosp_success, police_success, activity_success, infra_success]) / 4
+        confidence = round(data_quality * 85, 1)
+        
+        # Service status
+        unavailable = []
+        if not hosp_success and not police_success:
+            unavailable.append('emergency_services')
+        if not activity_success:
+            unavailable.append('activity_data')
+        if not infra_success:
+            unavailable.append('infrastructure')
+        
+        status_msg = "All services operational" if not unavailable else f"Limited data: {', '.join(unavailable)}"
+        status_color = "#4CAF50" if not unavailable else "#FF9800"
+
+        # Only the closest few places are reported, so select instead of sorting
+        top_hospitals = heapq.nsmallest(5, hospitals, key=_BY_DISTANCE)
+        top_police = heapq.nsmallest(5, police, key=_BY_DISTANCE)
+        top_bus_stops = heapq.nsmallest(10, bus_stops, key=_BY_DISTANCE)
+        top_trains = heapq.nsmallest(5, trains, key=_BY_DISTANCE)
+        
+        return {
+            'score': round(final_score, 1),
+            'rating': rating,
+            'color': color,
+            'confidence': confidence,
+            'timestamp': now.isoformat(),
+            'breakdown': {
+                'temporal_risk': round(time_score, 1),
+                'emergency_proximity': round(emerg_score, 1),
+                'population_density': round(pop_score, 1),
+                'infrastructure': round(infra_score, 1)
+            },
+            'time_period': period,
+            'service_status': {
+                'overall': status_msg,
+                'status_color': status_color,
+                'unavailable': unavailable,
+                'message': None
+            },
+            'nearest': {
+                'hospital': top_hospitals[0] if top_hospitals else None,
+                'police': top_police[0] if top_police else None,
+                'bus_stop': top_bus_stops[0] if top_bus_stops else None,
+                'train_station': top_trains[0] if top_trains else None
+            },
+            'all_places': {
+                'hospitals': top_hospitals,
+                'police_stations': top_police,
+                'bus_stops': top_bus_stops,
+                'train_stations': top_trains
+            },
+            'stats': {
+                'activity_count': act_count,
+                'infrastructure_count': infra_count,
+                'emergency_services_density': round(emergency_count / 25, 2) if emergency_count else 0
+            }
+        }
+        
+    except Exception as e:
+        logger.exception("Critical error while calculating safety score")
+
+        return {
+            'score': 0,
+            'rating': "ERROR",
+            'color': "#999999",
+            'confidence': 0,
+            'timestamp': datetime.now().isoformat(),
+            'breakdown': {
+                'temporal_risk': 0,
+                'emergency_proximity': 0,
+                'population_density': 0,
+                'infrastructure': 0
+            },
+            'time_period': f"{datetime.now().hour}:00",
+            'service_status': {
+                'overall': "System error occurred",
+                'status_color': "#f44336",
+                'unavailable': ['all'],
+                'message': f"Error: {str(e)[:100]}"
+            },
+            'nearest': {'hospital': None, 'police': None, 'bus_stop': None, 'train_station': None},
+            'all_places': {'hospitals': [], 'police_stations': [], 'bus_stops': [], 'train_stations': []},
+            'stats': {'activity_count': 0, 'infrastructure_count': 0, 'emergency_services_density': 0}
+        }
+
+
+def _haversine_scalar(φ1: float, cosφ1: float, λ1: float, lat2: float, lon2: float) -> float:
+    """Haversine distance in km from precomputed radians to a raw coordinate"""
+    φ2 = math.radians(lat2)
+    Δφ = φ2 - φ1
+    Δλ = math.radians(lon2) - λ1
+    a = math.sin(Δφ/2)**2 + cosφ1 * math.cos(φ2) * math.sin(Δλ/2)**2
+    return 12742 * math.asin(math.sqrt(min(1.0, a)))
+
+
+def _score_kernel(cell_lats, cell_lons, emerg_lats, emerg_lons,
+                  act_lats, act_lons, infra_lats, infra_lons, infra_radii,
+                  pop_multiplier, is_day):
+    """Per-cell (emergency, population, infrastructure) component scores
+
+    Plain nested loops over NumPy arrays on purpose: the function is
+    JIT-compiled with numba when available, which lowers the whole
+    thing to native code. Mirrors the cascades in calculate_safety_score.
+    """
+    n = cell_lats.shape[0]
+    out = np.empty((n, 3))
+
+    for i in range(n):
+        φ1 = math.radians(cell_lats[i])
+        cosφ1 = math.cos(φ1)
+        λ1 = math.radians(cell_lons[i])
+
+        # Emergency proximity
+        min_dist = math.inf
+        for j in range(emerg_lats.shape[0]):
+            dist = _haversine_scalar(φ1, cosφ1, λ1, emerg_lats[j], emerg_lons[j])
+            if dist < min_dist:
+                min_dist = dist
+
+        if emerg_lats.shape[0] == 0:
+            emerg_score = 22.0
+        elif min_dist <= 0.8:
+            emerg_score = 96.0
+        elif min_dist <= 1.5:
+            emerg_score = 85.0
+        elif min_dist <= 2.5:
+            emerg_score = 70.0
+        elif min_dist <= 4.0:
+            emerg_score = 50.0
+        else:
+            emerg_score = 30.0
+
+        # Population density (activity within 600 m)
+        act_count = 0
+        for j in range(act_lats.shape[0]):
+            if _haversine_scalar(φ1, cosφ1, λ1, act_lats[j], act_lons[j]) <= 0.6:
+                act_count += 1
+
+        if act_count >= 60:
+            pop_score = 92.0
+        elif act_count >= 40:
+            pop_score = 82.0
+        elif act_count >= 25:
+            pop_score = 68.0
+        elif act_count >= 12:
+            pop_score = 50.0
+        else:
+            pop_score = 35.0
+        pop_score *= pop_multiplier
+
+        # Infrastructure (each element counts within its category radius)
+        infra_count = 0
+        for j in range(infra_lats.shape[0]):
+            if _haversine_scalar(φ1, cosφ1, λ1, infra_lats[j], infra_lons[j]) <= infra_radii[j]:
+                infra_count += 1
+
+        if is_day:
+            infra_score = 80.0 if infra_count >= 20 else 65.0
+        else:
+            if infra_count >= 20:
+                infra_score = 85.0
+            elif infra_count >= 10:
+                infra_score = 60.0
+            else:
+                infra_score = 30.0
+
+        out[i, 0] = emerg_score
+        out[i, 1] = pop_score
+        out[i, 2] = infra_score
+
+    return out
+
+
+if njit is not None:
+    _haversine_scalar = njit(cache=True, fastmath=True)(_haversine_scalar)
+    _score_kernel = njit(cache=True, fastmath=True)(_score_kernel)
+
+
+def batch_calculate_safety_scores(points: List[Tuple[float, float]],
+                                  country_code: str = 'XX') -> List[Dict]:
+    """Score many nearby points at once (e.g. a city-scale heatmap grid)
+
+    Fetches OSM features in one Overpass request around the centroid,
+    with category radii widened to cover the whole grid, then runs the
+    numeric scoring kernel over every point. Returns one compact dict
+    per point (coordinates, score, rating, color, breakdown); the full
+    per-point payload of calculate_safety_score is not built here.
+    Falls back to per-point calculate_safety_score when NumPy is
+    unavailable or the batched fetch fails.
+    """
+    if not points:
+        return []
+
+    if np is None:
+        return [calculate_safety_score(lat, lon, country_code) for lat, lon in points]
+
+    cell_lats = np.asarray([p[0] for p in points], dtype=np.float64)
+    cell_lons = np.asarray([p[1] for p in points], dtype=np.float64)
+    center_lat = float(cell_lats.mean())
+    center_lon = float(cell_lons.mean())
+
+    # Widen every radius by the grid's spread so edge cells are covered
+    spread_km = float(max(_haversine_many(center_lat, center_lon, cell_lats, cell_lons)))
+    pad = int(math.ceil(spread_km * 1000))
+
+    clauses = ''.join(
+        _query_clause(place_type, radius + pad, center_lat, center_lon)
+        for place_type, radius in PLACE_RADII.items()
+    )
+    query = f"[out:json][timeout:{TIMEOUT}]; ({clauses}); out center qt;"
+    elements, success = fetch_osm_data(query)
+
+    if not success:
+        return [calculate_safety_score(lat, lon, country_code) for lat, lon in points]
+
+    coords = {place_type: ([], []) for place_type in PLACE_RADII}
+    for elem in elements:
+        place_type = _classify_element(elem.get('tags', {}))
+        if not place_type:
+            continue
+        e_lat = elem.get('lat', elem.get('center', {}).get('lat'))
+        e_lon = elem.get('lon', elem.get('center', {}).get('lon'))
+        if e_lat is not None and e_lon is not None:
+            coords[place_type][0].append(e_lat)
+            coords[place_type][1].append(e_lon)
+
+    def _as_arrays(*place_types):
+        lats = [c for t in place_types for c in coords[t][0]]
+        lons = [c for t in place_types for c in coords[t][1]]
+        return (np.asarray(lats, dtype=np.float64),
+                np.asarray(lons, dtype=np.float64))
+
+    emerg_lats, emerg_lons = _as_arrays('hospital', 'police')
+    act_lats, act_lons = _as_arrays('activity')
+    infra_lats, infra_lons = _as_arrays('infrastructure', 'bus_stop', 'train')
+    infra_radii = np.concatenate([
+        np.full(len(coords['infrastructure'][0]), 0.5),
+        np.full(len(coords['bus_stop'][0]), 1.0),
+        np.full(len(coords['train'][0]), 2.0)
+    ])
+
+    now = datetime.now()
+    time_score, period, pop_multiplier, is_day = _HOUR_TABLE[now.hour]
+    multiplier = COUNTRY_BASELINES.get(country_code, _DEFAULT_BASELINE)
+
+    components = _score_kernel(
+        cell_lats, cell_lons, emerg_lats, emerg_lons,
+        act_lats, act_lons, infra_lats, infra_lons, infra_radii,
+        pop_multiplier, is_day
+    )
+
+    results = []
+    for i, (lat, lon) in enumerate(points):
+        emerg_score, pop_score, infra_score = components[i]
+        raw_score = (
+            time_score * WEIGHTS['temporal_risk'] +
+            emerg_score * WEIGHTS['emergency_proximity'] +
+            pop_score * WEIGHTS['population_density'] +
+            infra_score * WEIGHTS['infrastructure']
+        )
+        final_score = min(max(raw_score * multiplier, 0), 100)
+        rating, color = _rating_color(final_score)
+
+        results.append({
+            'latitude': lat,
+            'longitude': lon,
+            'score': round(final_score, 1),
+            'rating': rating,
+            'color': color,
+            'timestamp': now.isoformat(),
+            'time_period': period,
+            'breakdown': {
+                'temporal_risk': round(time_score, 1),
+                'emergency_proximity': round(float(emerg_score), 1),
+                'population_density': round(float(pop_score), 1),
+                'infrastructure': round(float(infra_score), 1)
+            }
+        })
+
+    return results